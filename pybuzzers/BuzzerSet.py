@@ -1,9 +1,188 @@
+import asyncio
+import itertools
+import queue
 import threading
-from typing import Callable, Iterable, Optional
+import traceback
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
 
 import hid
 
 
+# Each buzzer reports its buttons as 5 consecutive bits, ordered red, yellow, green, orange, blue.
+# Button states are stored packed into an int with button j of buzzer i at bit 5i+j (j indexed according to COLOUR),
+# so list the report bit for each packed bit.
+_REPORT_BITS = tuple(5 * buzzer + offset for buzzer in range(4) for offset in (0, 4, 3, 2, 1))
+
+# (buzzer, button) represented by each packed bit
+_BIT_BUTTONS = tuple((bit // 5, bit % 5) for bit in range(20))
+
+# Packed bits of the red Buzz! button on every buzzer
+_BUZZ_BITS = 0b00001_00001_00001_00001
+
+
+def _pack_report_bits(report_bits: int) -> int:
+    """Rearrange the button bits of a report into packed order."""
+    return sum(2 ** bit for bit, report_bit in enumerate(_REPORT_BITS) if report_bits & 2 ** report_bit)
+
+
+# Packed button bits set by every possible value of each of the three button bytes (2, 3 & 4) in a report
+_PACKED_BYTE_2, _PACKED_BYTE_3, _PACKED_BYTE_4 = (
+    tuple(_pack_report_bits(value << 8 * byte) for value in range(256))
+    for byte in range(3)
+)
+
+# Button states of a single buzzer for every possible 5 bits of packed state
+_BUZZER_STATES = tuple(
+    tuple(bool(value & 2 ** i) for i in range(5))
+    for value in range(32)
+)
+
+
+# Event types
+_CHANGE = 0
+_BUZZ = 1
+_BUTTON_DOWN = 2
+_BUTTON_UP = 3
+
+
+# Light bytes of the output report for every possible 4-bit mask of lights on
+_LIGHTS_BYTES = tuple(
+    bytes(0xFF if mask & 2 ** i else 0x00 for i in range(4))
+    for mask in range(16)
+)
+
+
+@lru_cache(maxsize=256)
+def _buttons_state(bits: int) -> tuple[tuple[bool, ...], ...]:
+    """Expand packed button bits into the (shared) state tuple."""
+    return (
+        _BUZZER_STATES[bits & 0x1F],
+        _BUZZER_STATES[bits >> 5 & 0x1F],
+        _BUZZER_STATES[bits >> 10 & 0x1F],
+        _BUZZER_STATES[bits >> 15 & 0x1F]
+    )
+
+
+class _Reactor:
+    """
+        A single background thread reading from every BuzzerSet that is listening for events.
+        
+        hidapi does not expose file descriptors for its devices, so rather than waiting on them with select/poll
+        the thread polls each device with non-blocking reads, and waits for IDLE_INTERVAL when none had a report.
+        Registering or unregistering a BuzzerSet, or queueing a write, wakes the thread early.
+        When only one BuzzerSet is listening the thread instead waits inside a read from it with a timeout
+        (hidapi releases the GIL while reading), so that a new report is handled as soon as it arrives.
+        
+        Changes to the lights of a listening BuzzerSet are queued for the thread to write after each poll,
+        so that several changes made in quick succession are sent as a single write.
+        With a single BuzzerSet a queued write may wait for the read in progress, up to IDLE_INTERVAL.
+    """
+    # Longest wait between polls when idle. Longer waits use less CPU, but delay reports from
+    # other BuzzerSets when several are listening, and delay stop_listening and queued writes.
+    IDLE_INTERVAL_MS = 20
+    IDLE_INTERVAL = IDLE_INTERVAL_MS / 1000  # Seconds
+    
+    __lock: threading.Lock
+    __poll_lock: threading.Lock
+    __wake: threading.Event
+    __thread: Optional[threading.Thread]
+    __buzzer_sets: tuple["BuzzerSet", ...]
+    __writes: queue.SimpleQueue  # BuzzerSets with light changes to write
+    
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__poll_lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__thread = None
+        self.__buzzer_sets = ()
+        self.__writes = queue.SimpleQueue()
+    
+    def register(self, buzzer_set: "BuzzerSet"):
+        """Start reading from a BuzzerSet, starting the thread if it is not already running."""
+        with self.__lock:
+            if buzzer_set not in self.__buzzer_sets:
+                self.__buzzer_sets = (*self.__buzzer_sets, buzzer_set)
+            
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run)
+                self.__thread.start()
+        self.__wake.set()
+    
+    def unregister(self, buzzer_set: "BuzzerSet"):
+        """
+        Stop reading from a BuzzerSet. The thread exits once no BuzzerSets are left.
+        
+        Once this returns no more handlers will be fired for the BuzzerSet,
+        unless it is called by a handler running in the thread itself.
+        """
+        with self.__lock:
+            self.__buzzer_sets = tuple(other for other in self.__buzzer_sets if other is not buzzer_set)
+            thread = self.__thread
+        self.__wake.set()
+        
+        # Wait for any read in progress to finish
+        if thread is not threading.current_thread():
+            with self.__poll_lock:
+                pass
+    
+    def queue_write(self, buzzer_set: "BuzzerSet"):
+        """Have the thread write the pending light changes of a BuzzerSet after the current poll."""
+        self.__writes.put_nowait(buzzer_set)
+        self.__wake.set()
+    
+    def __run(self):
+        """Poll all registered BuzzerSets until none are left."""
+        received = True
+        while True:
+            buzzer_sets = self.__buzzer_sets
+            if not buzzer_sets:
+                with self.__lock:
+                    if not self.__buzzer_sets:
+                        self.__thread = None
+                        return
+                continue
+            
+            # Wait in the read itself if it is the only BuzzerSet and the last poll was idle
+            timeout_ms = self.IDLE_INTERVAL_MS if len(buzzer_sets) == 1 and not received else 0
+            
+            received = False
+            with self.__poll_lock:
+                for buzzer_set in buzzer_sets:
+                    if buzzer_set not in self.__buzzer_sets:  # Unregistered since this round started
+                        continue
+                    
+                    try:
+                        received = buzzer_set._poll(timeout_ms) or received
+                    except OSError:  # Connection to the buzzers has been lost
+                        self.__drop(buzzer_set)
+                    except Exception:  # Don't let one failing handler stop events for every BuzzerSet
+                        traceback.print_exc()
+                        self.__drop(buzzer_set)
+            
+            # Write all queued light changes in one burst
+            while not self.__writes.empty():
+                buzzer_set = self.__writes.get_nowait()
+                try:
+                    buzzer_set.flush_lights()
+                except OSError:
+                    self.__drop(buzzer_set)
+            
+            if not received and timeout_ms == 0 and self.__wake.wait(self.IDLE_INTERVAL):
+                self.__wake.clear()
+    
+    def __drop(self, buzzer_set: "BuzzerSet"):
+        """Stop reading from a BuzzerSet after an error, and tell it that it is no longer listening."""
+        self.unregister(buzzer_set)
+        try:
+            buzzer_set._stopped()
+        except OSError:  # Pending light changes can't be written if the connection has been lost
+            pass
+
+
+_reactor = _Reactor()
+
+
 class BuzzerSet:
     """
         Class representing a single set of 4 Buzz! buzzers.
@@ -14,23 +193,38 @@ class BuzzerSet:
         path bytes: The path to the USB connection for this BuzzerSet.
     """
     __existing_buzzer_sets = {}
-    __initialised = False
-    __thread: threading.Thread
     
-    __on_change: dict[str, Callable[["BuzzerSet", list[list[bool]]], None]]
-    __on_buzz: dict[str, Callable[["BuzzerSet", int], None]]
-    __on_button_down: dict[str, Callable[["BuzzerSet", int, int], None]]
-    __on_button_up: dict[str, Callable[["BuzzerSet", int, int], None]]
+    # Attributes are read from the background thread for every report, so store them in slots rather than a __dict__
+    __slots__ = (
+        "label", "path",
+        "__initialised",
+        "__handlers", "__label_counter",
+        "__on_change_handlers", "__on_buzz_handlers", "__on_button_down_handlers", "__on_button_up_handlers",
+        "__interface", "__state",
+        "__write_buffer", "__write_lock", "__lights_dirty", "__listening",
+    )
+    
+    __initialised: bool
+    __handlers: dict[str, tuple[int, Callable]]  # label: (event type, handler)
+    
+    __label_counter: Iterator[int]  # Numbers auto-generated handler labels
+    
+    # Handlers for each event type, rebuilt from __handlers whenever it changes, for the listen thread to iterate
+    __on_change_handlers: tuple[Callable[["BuzzerSet", tuple[tuple[bool, ...], ...]], None], ...]
+    __on_buzz_handlers: tuple[Callable[["BuzzerSet", int], None], ...]
+    __on_button_down_handlers: tuple[Callable[["BuzzerSet", int, int], None], ...]
+    __on_button_up_handlers: tuple[Callable[["BuzzerSet", int, int], None], ...]
     
     label: Optional[str]
     path: bytes
-    __interface_lock: threading.Lock
     __interface: hid.device
     
-    __stateLock: threading.Lock
-    __state: list[list[bool]]
+    __state: int  # Packed button bits, see _REPORT_BITS. Only ever replaced whole, so is read without locking.
     
-    __lights: list[bool]
+    __write_buffer: bytearray  # Output report, reused for every write. Bytes 2-5 hold the state of the lights.
+    __write_lock: threading.Lock  # Writes can come from the background thread or from flush_lights in any thread
+    __lights_dirty: bool  # Whether __write_buffer has changes not yet written
+    __listening: bool
     
     def __new__(cls, path: bytes):
         """
@@ -43,6 +237,7 @@ class BuzzerSet:
         
         # Otherwise create a new instance
         instance = super(BuzzerSet, cls).__new__(cls)
+        instance.__initialised = False
         BuzzerSet.__existing_buzzer_sets[path] = instance
         return instance
     
@@ -54,19 +249,18 @@ class BuzzerSet:
         self.path = path
         self.label = label
         
-        self.__lights = 4 * [False]
-        self.__stateLock = threading.Lock()
-        self.__state = 4 * [5 * [False]]
+        self.__write_buffer = bytearray(8)
+        self.__write_lock = threading.Lock()
+        self.__lights_dirty = False
+        self.__listening = False
+        self.__state = 0
         
-        self.__on_change = { }
-        self.__on_buzz = { }
-        self.__on_button_down = { }
-        self.__on_button_up = { }
+        self.__label_counter = itertools.count()
+        self.clear_handlers()
         
-        self.__interface_lock = threading.Lock()
-        with self.__interface_lock:
-            self.__interface = hid.device()
-            self.__interface.open_path(self.path)
+        self.__interface = hid.device()
+        self.__interface.open_path(self.path)
+        self.__interface.set_nonblocking(True)  # Reads are polled, see _Reactor
         self.set_lights_off()  # Set all lights to off at start so we know what state is
     
     def set_label(self, label: str):
@@ -74,37 +268,36 @@ class BuzzerSet:
         self.label = label
     
     # State methods
-    def get_buttons_state(self) -> list[list[int]]:
+    def get_buttons_state(self) -> tuple[tuple[bool, ...], ...]:
         """
         Return the last-received state of the buttons.
         
-        Returns a 2-d list where element (i,j) represents button j on buzzer i.
+        Returns a 2-d tuple where element (i,j) represents button j on buzzer i.
         Buttons are indexed according to COLOURS array or RED/BLUE/ORANGE/GREEN/YELLOW constants
+        
+        The state is read without locking, so may be a report behind a change that is being handled at the same time.
         """
-        with self.__stateLock:
-            return self.__state
+        return _buttons_state(self.__state)
     
     def get_lights_state(self) -> list[bool]:
         """Return the state of the lights as a list where element i represents the state of the light on buzzer i."""
-        return self.__lights
+        return [light != 0x00 for light in self.__write_buffer[2:6]]
     
     # Handlers
     def on_change(self,
-                  handler: Callable[["BuzzerSet", list[list[bool]]], None],
+                  handler: Callable[["BuzzerSet", tuple[tuple[bool, ...], ...]], None],
                   label: Optional[str] = None) -> str:
         """
         Register a handler to be fired any time the state of the system changes.
 
         Handler accepts two parameters,
             - BuzzerSet: A reference to this buzzer set
-            - list[list[bool]] The new state of the system
+            - tuple[tuple[bool, ...], ...] The new state of the system
         Set label optionally to reference this handler in remove_handler method.
 
-        Returns the label for this handler, auto-generated if not given.
+        Returns the label for this handler, auto-generated (and unique) if not given.
         """
-        label = label or str(handler)
-        self.__on_change[label] = handler
-        return label
+        return self.__add_handler(_CHANGE, handler, label)
     
     def on_buzz(self,
                 handler: Callable[["BuzzerSet", int], None],
@@ -117,11 +310,9 @@ class BuzzerSet:
             - int: The index of the buzzer pressed
         Set label optionally to reference this handler in remove_handler method.
         
-        Returns the label for this handler, auto-generated if not given.
+        Returns the label for this handler, auto-generated (and unique) if not given.
         """
-        label = label or str(handler)
-        self.__on_buzz[label] = handler
-        return label
+        return self.__add_handler(_BUZZ, handler, label)
     
     def on_button_down(self,
                        handler: Callable[["BuzzerSet", int, int], None],
@@ -135,11 +326,9 @@ class BuzzerSet:
             - int: The index of the button. See COLOURS constant.
         Set label optionally to reference this handler in remove_handler method.
 
-        Returns the label for this handler, auto-generated if not given.
+        Returns the label for this handler, auto-generated (and unique) if not given.
         """
-        label = label or str(handler)
-        self.__on_button_down[label] = handler
-        return label
+        return self.__add_handler(_BUTTON_DOWN, handler, label)
     
     def on_button_up(self,
                      handler: Callable[["BuzzerSet", int, int], None],
@@ -153,140 +342,231 @@ class BuzzerSet:
             - int: The index of the button. See COLOURS constant.
         Set label optionally to reference this handler in remove_handler method.
 
-        Returns the label for this handler, auto-generated if not given.
+        Returns the label for this handler, auto-generated (and unique) if not given.
         """
-        label = label or str(handler)
-        self.__on_button_up[label] = handler
-        return label
+        return self.__add_handler(_BUTTON_UP, handler, label)
     
     def remove_handler(self, label: str):
         """Remove the handler with given label."""
-        self.__on_change.pop(label, None)
-        self.__on_buzz.pop(label, None)
-        self.__on_button_down.pop(label, None)
-        self.__on_button_up.pop(label, None)
+        event_type, _ = self.__handlers.pop(label, (None, None))
+        if event_type is not None:
+            self.__update_handlers(event_type)
     
     def clear_handlers(self):
         """Remove all handlers"""
-        self.__on_change = {}
-        self.__on_buzz = {}
-        self.__on_button_up = {}
-        self.__on_button_down = {}
+        self.__handlers = {}
+        
+        self.__on_change_handlers = ()
+        self.__on_buzz_handlers = ()
+        self.__on_button_up_handlers = ()
+        self.__on_button_down_handlers = ()
+    
+    def __add_handler(self, event_type: int, handler: Callable, label: Optional[str]) -> str:
+        """Register a handler for the given event type, replacing any existing handler with the same label."""
+        if not label:
+            # Skip any generated labels already chosen by the user, so their handlers are not replaced
+            label = f"handler_{next(self.__label_counter)}"
+            while label in self.__handlers:
+                label = f"handler_{next(self.__label_counter)}"
+        
+        replaced_type, _ = self.__handlers.get(label, (None, None))
+        self.__handlers[label] = (event_type, handler)
+        
+        if replaced_type is not None and replaced_type != event_type:
+            self.__update_handlers(replaced_type)
+        self.__update_handlers(event_type)
+        return label
+    
+    def __update_handlers(self, event_type: int):
+        """Rebuild the tuple of handlers for the given event type from __handlers."""
+        handlers = tuple(handler for (handler_type, handler) in self.__handlers.values() if handler_type == event_type)
+        
+        if event_type == _CHANGE:
+            self.__on_change_handlers = handlers
+        elif event_type == _BUZZ:
+            self.__on_buzz_handlers = handlers
+        elif event_type == _BUTTON_DOWN:
+            self.__on_button_down_handlers = handlers
+        elif event_type == _BUTTON_UP:
+            self.__on_button_up_handlers = handlers
     
     # Listen loop
     def start_listening(self):
-        """Start listening for events from the buzzers in a new thread."""
-        self.__thread = threading.Thread(target=self.__listen_loop)
-        self.__thread.start()
+        """Start listening for events from the buzzers in the background thread."""
+        self.__listening = True
+        _reactor.register(self)
     
     def stop_listening(self):
-        """Stop listening for events from the buzzers and closes the thread."""
-        # Close & reopen the connection to force interface to stop reading
-        # This will trigger the break in __listen_loop to finish the thread
-        with self.__interface_lock:
-            self.__interface.close()
-            self.__interface = hid.device()
-            self.__interface.open_path(self.path)
-    
-    def __listen_loop(self):
         """
-        Run a loop listening for events from the buzzers, and passing to any registered handlers
+        Stop listening for events from the buzzers. The background thread closes once no BuzzerSet is listening.
         
-        Called from a new thread created in start_listening method.
-        Will exit automatically when `stop_listening` is called.
+        No handlers will fire after this returns, unless it is called from within a handler.
         """
-        while True:
+        _reactor.unregister(self)
+        self._stopped()
+    
+    def _stopped(self):
+        """
+        Mark this BuzzerSet as no longer listening, and write any light changes left queued for the background thread.
+        
+        Called by stop_listening, or by the background thread when it stops reading after an error, see _Reactor.
+        """
+        self.__listening = False
+        self.flush_lights()
+    
+    async def stream_events(self) -> AsyncIterator[tuple[int, int, bool]]:
+        """
+        Asynchronously iterate over button events until the iterator is closed.
+        
+        Yields tuples of (buzzer, button, pressed), where pressed is True when the button is pressed
+        and False when it is released. Buttons are indexed according to COLOUR.
+        Events are still read by the background thread, and passed to the running event loop,
+        so they only arrive while listening - see start_listening and stop_listening.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue[tuple[int, int, bool]] = asyncio.Queue()
+        
+        def put_event(event: tuple[int, int, bool]):
             try:
-                # Do not use __interface_lock as we want this to fail when the interface is closed in the main thread.
-                data = self.__interface.read(64)
-                new_state = BuzzerSet.__decode_state(data)
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            except RuntimeError:  # The event loop closed without closing this iterator
+                remove_handlers()
+        
+        def on_button_down(_: "BuzzerSet", buzzer: int, button: int):
+            put_event((buzzer, button, True))
+        
+        def on_button_up(_: "BuzzerSet", buzzer: int, button: int):
+            put_event((buzzer, button, False))
+        
+        def remove_handlers():
+            for label in labels:
+                self.remove_handler(label)
+        
+        labels = (self.on_button_down(on_button_down), self.on_button_up(on_button_up))
+        try:
+            while True:
+                yield await events.get()
+        finally:
+            remove_handlers()
+    
+    def _poll(self, timeout_ms: int = 0) -> bool:
+        """
+        Read all reports waiting from the buzzers, and pass any changes to registered handlers.
+        
+        Called from the background thread, see _Reactor.
+        Waits up to timeout_ms for a report if none are waiting. Returns whether any reports were read.
+        """
+        read = self.__interface.read
+        data = read(64, timeout_ms)
+        if not data:
+            return False
+        
+        # Drain every waiting report in one go, rather than one per poll of all BuzzerSets
+        while data:
+            # Decode inline as this runs for every report.
+            # Most reports repeat the previous state, so only handle the event if the buttons have changed
+            new_state = _PACKED_BYTE_2[data[2]] | _PACKED_BYTE_3[data[3]] | _PACKED_BYTE_4[data[4]]
+            if new_state != self.__state:
                 self.__handle_event(new_state)
-            except OSError:  # OSError triggered when connection is closed - see stop_listening method
-                break
-    
-    @staticmethod
-    def __decode_state(data: list[int]) -> list[list[bool]]:
-        """Decode the raw data from the buzzers into state list."""
-        data = [bool(num & 2 ** i) for num in data[2:5] for i in range(8)]  # Convert integers to boolean list
-        return [
-            [
-                data[0],
-                data[4],
-                data[3],
-                data[2],
-                data[1]
-            ],
-            [
-                data[5],
-                data[9],
-                data[8],
-                data[7],
-                data[6]
-            ],
-            [
-                data[10],
-                data[14],
-                data[13],
-                data[12],
-                data[11]
-            ],
-            [
-                data[15],
-                data[19],
-                data[18],
-                data[17],
-                data[16]
-            ]
-        ]
-    
-    def __handle_event(self, new_state: list[list[bool]]):
+            data = read(64)
+        return True
+    
+    def __handle_event(self, new_state: int):
         """Fire all appropriate handlers for state change"""
         old_state = self.__state
         
         # Update state
-        with self.__stateLock:
-            self.__state = new_state
+        self.__state = new_state
         
         # Identify any changed button states. Return early if no change.
-        button_downs = [(buzzer, button) for buzzer in range(4) for button in range(5)
-                        if new_state[buzzer][button] and not old_state[buzzer][button]]
-        button_ups = [(buzzer, button) for buzzer in range(4) for button in range(5)
-                      if not new_state[buzzer][button] and old_state[buzzer][button]]
-        if not any(button_ups) and not any(button_downs):
+        changed = new_state ^ old_state
+        if changed == 0:
             return
         
         # fire all on_change events
-        for event in self.__on_change.values():
-            event(self, new_state)
+        if self.__on_change_handlers:
+            state = _buttons_state(new_state)
+            for event in self.__on_change_handlers:
+                event(self, state)
         
-        for (buzzer, button) in button_downs:
+        # Only look for changes to buttons which have handlers to fire
+        if self.__on_button_down_handlers:
+            button_downs = changed & new_state
+        elif self.__on_buzz_handlers:
+            button_downs = changed & new_state & _BUZZ_BITS
+        else:
+            button_downs = 0
+        
+        while button_downs:
+            bit = button_downs & -button_downs  # Lowest set bit
+            button_downs ^= bit
+            buzzer, button = _BIT_BUTTONS[bit.bit_length() - 1]
+            
             # Fire new button presses
-            for event in self.__on_button_down.values():
+            for event in self.__on_button_down_handlers:
                 event(self, buzzer, button)
             
             # Fire new buzzes
             if button == 0:
-                for event in self.__on_buzz.values():
+                for event in self.__on_buzz_handlers:
                     event(self, buzzer)
         
-        for (buzzer, button) in button_ups:
+        button_ups = changed & old_state if self.__on_button_up_handlers else 0
+        while button_ups:
+            bit = button_ups & -button_ups
+            button_ups ^= bit
+            buzzer, button = _BIT_BUTTONS[bit.bit_length() - 1]
+            
             # Fire new button ups
-            for event in self.__on_button_up.values():
+            for event in self.__on_button_up_handlers:
                 event(self, buzzer, button)
     
     # LIGHTS
     def set_lights(self, lights: list[bool]):
-        """Set the lights to a new state, given as list of one boolean for each buzzer."""
-        self.__lights = lights
-        binLights = [0xFF if light else 0x00 for light in lights]
+        """
+        Set the lights to a new state, given as list of one boolean for each buzzer.
         
-        with self.__interface_lock:
-            self.__interface.write([0x0, 0x0, *binLights, 0x0, 0x0])
+        While listening the change is written by the background thread, see flush_lights.
+        """
+        mask = sum(2 ** i for i, light in enumerate(lights[:4]) if light)
+        self.__write_buffer[2:6] = _LIGHTS_BYTES[mask]
+        self.__lights_changed()
     
     def set_light(self, buzzer: int, light: bool):
-        """Change the state of one light, leaving the other buzzers as they are."""
-        self.__lights[buzzer] = light
-        self.set_lights(self.__lights)
+        """
+        Change the state of one light, leaving the other buzzers as they are.
+        
+        While listening the change is written by the background thread, see flush_lights.
+        """
+        if not -4 <= buzzer < 4:
+            raise IndexError(f"Buzzer index {buzzer} out of range")
+        
+        self.__write_buffer[2 + buzzer % 4] = 0xFF if light else 0x00  # Negative indices count from the last buzzer
+        self.__lights_changed()
+    
+    def flush_lights(self):
+        """
+        Write any pending changes to the lights to the buzzers.
+        
+        While listening, light changes are written by the background thread shortly afterwards,
+        so that several changes made together are sent in one write. Call this to write them immediately instead.
+        """
+        if not self.__lights_dirty:
+            return
+        
+        with self.__write_lock:
+            if self.__lights_dirty:
+                self.__lights_dirty = False
+                self.__interface.write(self.__write_buffer)
+    
+    def __lights_changed(self):
+        """Write the changed output buffer now, or queue it to be written by the background thread if listening."""
+        if not self.__listening:
+            self.__lights_dirty = True
+            self.flush_lights()
+        elif not self.__lights_dirty:  # Otherwise it is already queued
+            self.__lights_dirty = True
+            _reactor.queue_write(self)
     
     def set_lights_on(self):
         """Set all lights on."""
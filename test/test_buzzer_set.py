@@ -0,0 +1,275 @@
+import itertools
+import queue
+import random
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+try:
+    import hid
+except ImportError:  # Tests only use FakeDevice, so hidapi itself isn't needed to run them
+    hid = types.ModuleType("hid")
+    hid.device = None
+    hid.enumerate = lambda *args, **kwargs: []
+    sys.modules["hid"] = hid
+
+from pybuzzers import BuzzerSet
+from pybuzzers.BuzzerSet import _PACKED_BYTE_2, _PACKED_BYTE_3, _PACKED_BYTE_4, _buttons_state
+
+
+class FakeDevice:
+    """Stand-in for hid.device, fed reports by the test and recording writes."""
+
+    def __init__(self):
+        self.reports = queue.Queue()
+        self.writes = []
+        self.nonblocking = False
+        self.fail = False  # Raise OSError from reads and writes, as if the device was unplugged
+
+    def open_path(self, path: bytes):
+        self.path = path
+
+    def set_nonblocking(self, nonblocking: bool):
+        self.nonblocking = nonblocking
+
+    def read(self, max_length: int, timeout_ms: int = 0) -> list[int]:
+        if self.fail:
+            raise OSError("read error")
+        try:
+            if timeout_ms > 0:
+                return self.reports.get(timeout=timeout_ms / 1000)
+            return self.reports.get_nowait()
+        except queue.Empty:
+            return []
+
+    def write(self, buffer) -> int:
+        if self.fail:
+            raise OSError("write error")
+        self.writes.append(bytes(buffer))
+        return len(buffer)
+
+    def send(self, *buttons: tuple[int, int]):
+        """Queue a report with the given (buzzer, button) pairs pressed."""
+        bits = 0
+        for buzzer, button in buttons:
+            bits |= 2 ** (5 * buzzer + (0, 4, 3, 2, 1)[button])
+        self.reports.put([0x7F, 0x7F, bits & 0xFF, bits >> 8 & 0xFF, bits >> 16 | 0xF0])
+
+
+def baseline_decode(data: list[int]) -> list[list[bool]]:
+    """The original list-based decoder, for comparison."""
+    data = [bool(num & 2 ** i) for num in data[2:5] for i in range(8)]
+    return [[data[5 * buzzer + offset] for offset in (0, 4, 3, 2, 1)] for buzzer in range(4)]
+
+
+def wait_until(predicate, timeout: float = 1) -> bool:
+    end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+class BuzzerSetTestCase(unittest.TestCase):
+    paths = itertools.count()
+
+    def setUp(self):
+        self.devices: list[FakeDevice] = []
+        patcher = mock.patch.object(hid, "device", self.new_device)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buzzer_sets = []
+
+    def tearDown(self):
+        for buzzer_set in self.buzzer_sets:
+            buzzer_set.stop_listening()
+
+    def new_device(self) -> FakeDevice:
+        device = FakeDevice()
+        self.devices.append(device)
+        return device
+
+    def new_buzzer_set(self) -> tuple[BuzzerSet, FakeDevice]:
+        """Create a BuzzerSet with a new path, as instances are shared per path."""
+        buzzer_set = BuzzerSet(f"test-{next(self.paths)}".encode())
+        self.buzzer_sets.append(buzzer_set)
+        return buzzer_set, self.devices[-1]
+
+
+class TestDecode(unittest.TestCase):
+    def test_matches_baseline_decoder(self):
+        rng = random.Random(0)
+        samples = [[0, 0] + [rng.randrange(256) for _ in range(3)] for _ in range(5000)]
+        samples += [[0, 0, *(2 ** bit).to_bytes(3, "little")] for bit in range(24)]
+
+        for data in samples:
+            bits = _PACKED_BYTE_2[data[2]] | _PACKED_BYTE_3[data[3]] | _PACKED_BYTE_4[data[4]]
+            self.assertEqual([list(buzzer) for buzzer in _buttons_state(bits)], baseline_decode(data))
+
+
+class TestDispatch(BuzzerSetTestCase):
+    def test_handler_subsets(self):
+        reports = [[(0, 0)], [(0, 0)], [(0, 1), (2, 0)], [(2, 0), (3, 4)], []]
+
+        # Expected events from diffing the baseline decoder's states
+        expected = []
+        old = [[False] * 5 for _ in range(4)]
+        for pressed in reports:
+            device = FakeDevice()
+            device.send(*pressed)
+            new = baseline_decode(device.reports.get())
+            if new == old:
+                continue
+
+            expected.append(("change", new))
+            for buzzer, button in itertools.product(range(4), range(5)):
+                if new[buzzer][button] and not old[buzzer][button]:
+                    expected.append(("down", buzzer, button))
+                    if button == 0:
+                        expected.append(("buzz", buzzer))
+            for buzzer, button in itertools.product(range(4), range(5)):
+                if old[buzzer][button] and not new[buzzer][button]:
+                    expected.append(("up", buzzer, button))
+            old = new
+
+        for count in range(5):
+            for kinds in itertools.combinations(("change", "down", "up", "buzz"), count):
+                with self.subTest(kinds=kinds):
+                    buzzer_set, device = self.new_buzzer_set()
+                    events = []
+                    if "change" in kinds:
+                        buzzer_set.on_change(lambda _, state: events.append(("change", [list(b) for b in state])))
+                    if "down" in kinds:
+                        buzzer_set.on_button_down(lambda _, buzzer, button: events.append(("down", buzzer, button)))
+                    if "up" in kinds:
+                        buzzer_set.on_button_up(lambda _, buzzer, button: events.append(("up", buzzer, button)))
+                    if "buzz" in kinds:
+                        buzzer_set.on_buzz(lambda _, buzzer: events.append(("buzz", buzzer)))
+
+                    for pressed in reports:
+                        device.send(*pressed)
+                    buzzer_set._poll()
+
+                    self.assertEqual(events, [event for event in expected if event[0] in kinds])
+                    self.assertEqual([list(b) for b in buzzer_set.get_buttons_state()], old)
+
+
+class TestLights(BuzzerSetTestCase):
+    def test_writes_immediately_when_not_listening(self):
+        buzzer_set, device = self.new_buzzer_set()
+        buzzer_set.set_light(1, True)
+        buzzer_set.set_light(-1, True)
+        self.assertEqual(device.writes[-1], bytes([0, 0, 0, 0xFF, 0, 0xFF, 0, 0]))
+        self.assertEqual(buzzer_set.get_lights_state(), [False, True, False, True])
+        self.assertRaises(IndexError, buzzer_set.set_light, 4, True)
+
+    def test_burst_is_coalesced_while_listening(self):
+        buzzer_set, device = self.new_buzzer_set()
+        buzzer_set.start_listening()
+        writes = len(device.writes)
+
+        for buzzer in range(4):
+            buzzer_set.set_light(buzzer, True)
+
+        self.assertTrue(wait_until(lambda: len(device.writes) > writes))
+        time.sleep(0.05)
+        self.assertEqual(device.writes[writes:], [bytes([0, 0, 0xFF, 0xFF, 0xFF, 0xFF, 0, 0])])
+
+
+class TestListening(BuzzerSetTestCase):
+    def test_stop_listening_is_synchronous(self):
+        buzzer_set, device = self.new_buzzer_set()
+        started, finished = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_handler(_, buzzer):
+            calls.append(buzzer)
+            started.set()
+            time.sleep(0.1)
+            finished.set()
+
+        buzzer_set.on_buzz(slow_handler)
+        buzzer_set.start_listening()
+        device.send((0, 0))
+        self.assertTrue(started.wait(1))
+
+        buzzer_set.stop_listening()
+        self.assertTrue(finished.is_set())
+
+        device.send()
+        device.send((1, 0))
+        time.sleep(0.1)
+        self.assertEqual(calls, [0])
+
+    def test_reactor_survives_dropped_buzzer_set(self):
+        failing_set, failing_device = self.new_buzzer_set()
+        other_set, other_device = self.new_buzzer_set()
+        buzzes = []
+        other_set.on_buzz(lambda _, buzzer: buzzes.append(buzzer))
+        failing_set.start_listening()
+        other_set.start_listening()
+
+        # Lose the device with a light change pending, so flushing it when the set is dropped fails too
+        def unplug(_, buzzer):
+            failing_set.set_light(0, True)
+            failing_device.fail = True
+            raise OSError("device unplugged")
+
+        failing_set.on_buzz(unplug)
+        failing_device.send((0, 0))
+        self.assertTrue(wait_until(lambda: failing_device.fail))
+        time.sleep(0.05)
+
+        other_device.send((2, 0))
+        self.assertTrue(wait_until(lambda: buzzes == [2]))
+
+        # The dropped set is no longer listening, so writes immediately again once the device recovers
+        failing_device.fail = False
+        failing_set.set_light(1, True)
+        self.assertEqual(failing_device.writes[-1], bytes([0, 0, 0xFF, 0xFF, 0, 0, 0, 0]))
+
+        # The thread exits once nothing is listening, and restarts when listening starts again
+        other_set.stop_listening()
+        other_set.start_listening()
+        other_device.send()
+        other_device.send((3, 0))
+        self.assertTrue(wait_until(lambda: buzzes == [2, 3]))
+
+    def test_idle_reactor_waits_between_polls(self):
+        reads = []
+        for _ in range(2):
+            buzzer_set, device = self.new_buzzer_set()
+            device.read = mock.Mock(side_effect=device.read)
+            reads.append(device.read)
+            buzzer_set.start_listening()
+
+        time.sleep(0.2)
+        self.assertLess(sum(read.call_count for read in reads), 100)
+
+    def test_failing_handler_drops_only_its_buzzer_set(self):
+        failing_set, failing_device = self.new_buzzer_set()
+        other_set, other_device = self.new_buzzer_set()
+        buzzes = []
+
+        def failing_handler(_, buzzer):
+            raise ValueError("handler failed")
+
+        failing_set.on_buzz(failing_handler)
+        other_set.on_buzz(lambda _, buzzer: buzzes.append(buzzer))
+        failing_set.start_listening()
+        other_set.start_listening()
+
+        with mock.patch("traceback.print_exc"):
+            failing_device.send((0, 0))
+            time.sleep(0.1)
+
+        other_device.send((1, 0))
+        self.assertTrue(wait_until(lambda: buzzes == [1]))
+
+
+if __name__ == "__main__":
+    unittest.main()